@@ -1,12 +1,21 @@
+import json
 import time
 import uuid
 import logging
 import re
 import random
+from collections import deque
 from threading import Lock
 from flask import request, jsonify
 from locust.runners import MasterRunner, WorkerRunner
 from locust import HttpUser, task, between, events, LoadTestShape
+import urllib3
+
+# Disable SSL warnings once per process rather than per spawned user
+urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+
+# Precompiled pattern for ${VarName} templates
+_VAR_RE = re.compile(r'\$\{(\w+)\}')
 
 # ============================================================
 # LOGGING CONFIGURATION
@@ -38,6 +47,7 @@ transaction_logger.propagate = False  # Don't propagate to root logger
 
 DEBUGGING_MODE = False  # Set to True to enable detailed logging for failures
 SMOKE_MODE = False  # Set to True to run 2 users, 1 iteration, and print curl commands
+RANDOM_BATCH_SIZE = 256  # Values drawn per refill for "random" variables
 
 # ============================================================
 # UTILITY CLASSES - ADVANCED FEATURES
@@ -48,15 +58,17 @@ class VariableManager:
     
     def __init__(self):
         self.variables = {}
-        self.locks = {}
-        self.indices = {}
         self.combination_groups = {}  # Store combination group indices
+        self.random_pools = {}  # Prefetched draws for "random" variables
         
     def register_variable(self, name, config):
         """Register a variable with its configuration"""
+        # Keep everything get_value needs on the config itself: one lookup per fetch
+        config["_values"] = tuple(config.get("values", []))
+        config["_length"] = len(config["_values"])
+        config["_lock"] = Lock()
+        config["_index"] = 0
         self.variables[name] = config
-        self.locks[name] = Lock()
-        self.indices[name] = 0
         
     def register_combination_group(self, group_name, variable_names):
         """Register a group of variables that should be used in combination"""
@@ -68,16 +80,17 @@ class VariableManager:
     
     def get_value(self, name, user_id=None):
         """Get variable value based on distribution type"""
-        if name not in self.variables:
+        config = self.variables.get(name)
+        if config is None:
             return f"${{{name}}}"
             
-        config = self.variables[name]
         var_type = config.get("type", "sequential")
-        values = config.get("values", [])
+        values = config["_values"]
+        length = config["_length"]
         recycle = config.get("recycle_on_eof", True)
         combination_group = config.get("combination_group")  # Check if part of a combination
         
-        if not values:
+        if not length:
             return f"${{{name}}}"
         
         # Handle combination group variables
@@ -85,7 +98,7 @@ class VariableManager:
             group = self.combination_groups[combination_group]
             with group["lock"]:
                 idx = group["index"]
-                if idx >= len(values):
+                if idx >= length:
                     if recycle:
                         idx = 0
                         group["index"] = 0
@@ -99,32 +112,34 @@ class VariableManager:
         
         # Handle non-combination variables
         if var_type == "random":
-            return random.choice(values)
+            try:
+                return self.random_pools[name].popleft()
+            except (KeyError, IndexError):
+                pool = deque(random.choices(values, k=RANDOM_BATCH_SIZE))
+                self.random_pools[name] = pool
+                return pool.popleft()
         elif var_type == "sequential":
-            with self.locks[name]:
-                idx = self.indices[name]
-                if idx >= len(values):
-                    if recycle:
-                        idx = 0
-                        self.indices[name] = 0
-                    else:
+            with config["_lock"]:
+                idx = config["_index"]
+                if idx >= length:
+                    if not recycle:
                         raise StopIteration(f"All values for {name} have been used")
+                    idx = 0
                 value = values[idx]
-                self.indices[name] += 1
+                config["_index"] = idx + 1
                 return value
         elif var_type == "unique":
-            with self.locks[name]:
-                idx = self.indices[name]
-                if idx >= len(values):
+            with config["_lock"]:
+                idx = config["_index"]
+                if idx >= length:
                     if not recycle:
                         raise StopIteration(f"All values for {name} have been used")
                     idx = 0
-                    self.indices[name] = 0
                 value = values[idx]
-                self.indices[name] += 1
+                config["_index"] = idx + 1
                 return value
         
-        return values[0] if values else f"${{{name}}}"
+        return values[0]
 
 
 class CorrelationEngine:
@@ -132,32 +147,20 @@ class CorrelationEngine:
     
     def __init__(self):
         self.global_store = {}
-        self.session_store = {}
         self.lock = Lock()
         
-    def extract_and_store(self, response_text, pattern, var_name, scope="session", user_id=None):
-        """Extract value using regex and store in session or global scope"""
+    def extract_and_store(self, response_text, pattern, var_name, scope="session", session=None):
+        """Extract value using regex and store in the user's session dict or global scope"""
         match = re.search(pattern, response_text)
         if match:
             value = match.group(1) if match.groups() else match.group(0)
             if scope == "global":
                 with self.lock:
                     self.global_store[var_name] = value
-            else:  # session scope
-                if user_id not in self.session_store:
-                    self.session_store[user_id] = {}
-                self.session_store[user_id][var_name] = value
+            elif session is not None:  # session scope
+                session[var_name] = value
             return value
         return None
-    
-    def get_value(self, var_name, scope="session", user_id=None):
-        """Retrieve stored correlation value"""
-        if scope == "global":
-            return self.global_store.get(var_name)
-        else:
-            if user_id in self.session_store:
-                return self.session_store[user_id].get(var_name)
-        return None
 
 
 class ConstantThroughputTimer:
@@ -165,26 +168,22 @@ class ConstantThroughputTimer:
     
     def __init__(self):
         self.timers = {}
-        self.locks = {}
         
     def wait(self, requests_per_minute, timer_id="default"):
-        """Wait to maintain constant throughput"""
-        if timer_id not in self.timers:
-            self.timers[timer_id] = {"last_request": 0, "count": 0}
-            self.locks[timer_id] = Lock()
-        
-        with self.locks[timer_id]:
-            target_interval = 60.0 / requests_per_minute
-            current_time = time.time()
-            
-            if self.timers[timer_id]["last_request"] > 0:
-                elapsed = current_time - self.timers[timer_id]["last_request"]
-                sleep_time = max(0, target_interval - elapsed)
-                if sleep_time > 0:
-                    time.sleep(sleep_time)
-            
-            self.timers[timer_id]["last_request"] = time.time()
-            self.timers[timer_id]["count"] += 1
+        """Wait for this caller's slot to maintain constant throughput"""
+        now = time.monotonic()
+        timer = self.timers.get(timer_id)
+        if timer is None:
+            timer = self.timers.setdefault(timer_id, {"next": now})
+        
+        # Claim the next free slot, never one in the past, so idle time cannot
+        # bank up a burst. Nothing yields between this read and write under
+        # gevent, so each caller gets its own slot without a lock.
+        slot = max(timer["next"], now)
+        timer["next"] = slot + 60.0 / requests_per_minute
+        sleep_time = slot - now
+        if sleep_time > 0:
+            time.sleep(sleep_time)
 
 # ============================================================
 # GLOBAL INSTANCES
@@ -239,15 +238,9 @@ stages = [
 # GLOBAL SCENARIO STATE (MASTER ONLY)
 # ============================================================
 
-# Start with no scenarios active - user selects via web UI
-ACTIVE_SCENARIOS = set()
-SCENARIO_LOCK = Lock()
-
-# Map scenarios to user classes for proper spawn control
-SCENARIO_TO_USER_CLASS = {
-    "Script_01": "Script_01_User",
-    "Script_02": "Script_02_User",
-}
+# Start with no scenarios active - user selects via web UI.
+# Always rebound to a new frozenset, so readers need no lock.
+ACTIVE_SCENARIOS = frozenset()
 
 # ============================================================
 # SCRIPT DEFINITIONS
@@ -304,6 +297,75 @@ Script_02 = [
     },
 ]
 
+# ============================================================
+# SCRIPT COMPILATION - PRE-RESOLVED SUBSTITUTION PLANS
+# ============================================================
+
+def compile_template(template):
+    """Split a template into alternating literal / variable-name tokens"""
+    return tuple(_VAR_RE.split(template))
+
+
+def compile_json_body(body):
+    """Serialise a JSON body once into a bytes %-template plus the variables it needs"""
+    var_names = []
+
+    def placeholder(match):
+        var_name = match.group(1)
+        if var_name not in var_names:
+            var_names.append(var_name)
+        return f"%({var_name})s"
+
+    text = json.dumps(body, separators=(",", ":")).replace("%", "%%")
+    return _VAR_RE.sub(placeholder, text).encode(), tuple(var_names)
+
+
+def compile_script(script):
+    """Attach substitution plans to every transaction so requests never run the regex"""
+    for transaction in script:
+        transaction["_url_plan"] = compile_template(transaction["url"])
+        # Headers without ${...} never change, so only the templated ones get plans
+        headers = {key: str(value) for key, value in transaction.get("headers", {}).items()}
+        body = transaction.get("body")
+        if body and isinstance(body, (dict, list)):
+            # JSON bodies are sent pre-encoded, so requests no longer adds this header
+            if not any(key.lower() == "content-type" for key in headers):
+                headers["Content-Type"] = "application/json"
+        transaction["_static_headers"] = {key: value for key, value in headers.items() if '${' not in value}
+        transaction["_dynamic_headers"] = tuple(
+            (key, compile_template(value)) for key, value in headers.items() if '${' in value
+        )
+        transaction["_corr_id_keys"] = tuple(key for key in headers if key.lower() == "correlationid")
+        if body and isinstance(body, (dict, list)):
+            transaction["_body_template"], transaction["_body_vars"] = compile_json_body(body)
+            # Mapping keys for bytes %-formatting must themselves be bytes
+            transaction["_body_keys"] = tuple(var_name.encode() for var_name in transaction["_body_vars"])
+        elif body:
+            transaction["_body_plan"] = compile_template(str(body))
+    
+    # Static headers shared by every transaction are set once on the user's session;
+    # correlation ids stay per-request because they are regenerated on every call
+    shared = dict(script[0]["_static_headers"]) if script else {}
+    for transaction in script[1:]:
+        static = transaction["_static_headers"]
+        shared = {key: value for key, value in shared.items() if static.get(key) == value}
+    shared = {key: value for key, value in shared.items() if key.lower() != "correlationid"}
+    for transaction in script:
+        transaction["_session_headers"] = shared
+        transaction["_static_headers"] = {
+            key: value for key, value in transaction["_static_headers"].items() if key not in shared
+        }
+    return script
+
+
+SCRIPTS = {
+    "Script_01": Script_01,
+    "Script_02": Script_02,
+}
+
+for script in SCRIPTS.values():
+    compile_script(script)
+
 # ============================================================
 # REQUEST EXECUTOR - ENHANCED WITH ALL FEATURES
 # ============================================================
@@ -319,8 +381,6 @@ class RequestExecutor:
     
     def generate_curl_command(self, method, url, headers, body):
         """Generate curl command for the request in the exact format"""
-        import json
-        
         # Start with curl --location --request
         curl_parts = [f"curl --location --request {method} '{url}'"]
         
@@ -330,8 +390,10 @@ class RequestExecutor:
         
         # Add body with beautified JSON
         if body:
-            if isinstance(body, (dict, list)):
+            if isinstance(body, (dict, list, bytes)):
                 # Beautify JSON with 4-space indentation
+                if isinstance(body, bytes):
+                    body = json.loads(body)
                 body_str = json.dumps(body, indent=4)
                 curl_parts.append(f"--data-raw '{body_str}'")
             else:
@@ -341,40 +403,37 @@ class RequestExecutor:
         # Join with backslash and newline for readability
         return " \\\n".join(curl_parts)
         
-    def substitute_variables(self, text, user_id):
-        """Replace ${VarName} with actual values"""
-        if not isinstance(text, str):
-            return text
-        
-        pattern = r'\$\{(\w+)\}'
-        
-        def replacer(match):
-            var_name = match.group(1)
-            # Check correlation values first
-            corr_value = self.corr_engine.get_value(var_name, scope="session", user_id=user_id)
-            if corr_value:
-                return str(corr_value)
-            corr_value = self.corr_engine.get_value(var_name, scope="global")
-            if corr_value:
-                return str(corr_value)
-            # Then check variable manager
-            return str(self.var_manager.get_value(var_name, user_id))
-        
-        return re.sub(pattern, replacer, text)
+    def resolve(self, var_names, user_id, session):
+        """Resolve variable names to string values, in order"""
+        # Bind the lookups once: session correlation, then global correlation, then test data
+        get_session = session.get
+        get_global = self.corr_engine.global_store.get
+        get_variable = self.var_manager.get_value
+        return [
+            str(get_session(var_name) or get_global(var_name) or get_variable(var_name, user_id))
+            for var_name in var_names
+        ]
     
-    def substitute_variables_in_object(self, obj, user_id):
-        """Recursively substitute variables in dict/list objects"""
-        import json
-        if isinstance(obj, dict):
-            return {key: self.substitute_variables_in_object(value, user_id) for key, value in obj.items()}
-        elif isinstance(obj, list):
-            return [self.substitute_variables_in_object(item, user_id) for item in obj]
-        elif isinstance(obj, str):
-            return self.substitute_variables(obj, user_id)
-        else:
-            return obj
+    def render(self, plan, user_id, session):
+        """Build a string from a compiled template plan"""
+        if len(plan) == 1:
+            return plan[0]
+        parts = list(plan)
+        parts[1::2] = self.resolve(plan[1::2], user_id, session)
+        return "".join(parts)
     
-    def execute_request(self, transaction_config, user_id, iteration, execute_once=False):
+    def render_body(self, transaction_config, user_id, session):
+        """Build the request body from the transaction's compiled template"""
+        if "_body_plan" in transaction_config:
+            return self.render(transaction_config["_body_plan"], user_id, session)
+        values = self.resolve(transaction_config["_body_vars"], user_id, session)
+        # json.dumps escapes each value exactly as it would inside the full document
+        return transaction_config["_body_template"] % {
+            key: json.dumps(value)[1:-1].encode()
+            for key, value in zip(transaction_config["_body_keys"], values)
+        }
+    
+    def execute_request(self, transaction_config, user_id, iteration, session=None, execute_once=False):
         """Execute a single HTTP request with all features"""
         if execute_once:
             # Once-only controller logic can be added here
@@ -388,33 +447,28 @@ class RequestExecutor:
         
         # Prepare request
         method = transaction_config.get("method", "GET").upper()
-        url = self.substitute_variables(transaction_config["url"], user_id)
-        headers = transaction_config.get("headers", {})
+        if session is None:
+            session = {}
+        url = self.render(transaction_config["_url_plan"], user_id, session)
         
         # Substitute variables in headers
-        processed_headers = {}
-        for key, value in headers.items():
-            processed_headers[key] = self.substitute_variables(str(value), user_id)
+        processed_headers = dict(transaction_config["_static_headers"])
+        for key, plan in transaction_config["_dynamic_headers"]:
+            processed_headers[key] = self.render(plan, user_id, session)
         
-        # Generate unique correlationId for headers that contain correlationId
-        if "correlationId" in processed_headers or "CorrelationId" in processed_headers:
-            unique_correlation_id = str(uuid.uuid4())
-            if "correlationId" in processed_headers:
-                processed_headers["correlationId"] = unique_correlation_id
-            if "CorrelationId" in processed_headers:
-                processed_headers["CorrelationId"] = unique_correlation_id
+        # Generate unique correlationId for the header keys compiled as correlation ids
+        corr_id_keys = transaction_config["_corr_id_keys"]
+        if corr_id_keys:
+            unique_correlation_id = uuid.uuid4().hex
+            for key in corr_id_keys:
+                processed_headers[key] = unique_correlation_id
         
         # Prepare body with proper variable substitution
         body = transaction_config.get("body")
         processed_body = None
         
         if body:
-            if isinstance(body, (dict, list)):
-                # Handle dict/list objects - substitute variables recursively
-                processed_body = self.substitute_variables_in_object(body, user_id)
-            else:
-                # Handle string body
-                processed_body = self.substitute_variables(str(body), user_id)
+            processed_body = self.render_body(transaction_config, user_id, session)
         
         # Print curl command in SMOKE_MODE
         if SMOKE_MODE:
@@ -423,16 +477,17 @@ class RequestExecutor:
             print(f"SMOKE MODE - Transaction: {transaction_name}")
             print(f"User: {user_id} | Iteration: {iteration}")
             print("="*80)
-            curl_cmd = self.generate_curl_command(method, url, processed_headers, processed_body)
+            curl_headers = {**transaction_config["_session_headers"], **processed_headers}
+            curl_cmd = self.generate_curl_command(method, url, curl_headers, processed_body)
             print("\nCURL Command:")
             print(curl_cmd)
             print("="*80 + "\n")
         
         # Extract OrderId from URL for logging
         order_id = "N/A"
-        order_id_match = re.search(r'orderId=([^&\s]+)', url)
-        if order_id_match:
-            order_id = order_id_match.group(1)
+        _, sep, rest = url.partition("orderId=")
+        if sep:
+            order_id = rest.split("&", 1)[0] or "N/A"
         
         # Execute request
         transaction_name = transaction_config.get("transaction_name", "Request")
@@ -441,8 +496,7 @@ class RequestExecutor:
             method=method,
             url=url,
             headers=processed_headers,
-            json=processed_body if isinstance(processed_body, (dict, list)) else None,
-            data=processed_body if isinstance(processed_body, str) else None,
+            data=processed_body,
             name=transaction_name,
             catch_response=True
         ) as response:
@@ -452,10 +506,13 @@ class RequestExecutor:
             # Perform checks
             checks = transaction_config.get("checks", {})
             
-            if "status" in checks:
-                expected_status = checks["status"]
-                if response.status_code != expected_status:
-                    response.failure(f"Status code {response.status_code} != {expected_status}")
+            expected_status = checks.get("status")
+            if expected_status is not None:
+                status_code = response.status_code
+                if status_code == expected_status:
+                    response.success()
+                else:
+                    response.failure(f"Status code {status_code} != {expected_status}")
                     
                     # Debug logging for failures
                     if DEBUGGING_MODE:
@@ -464,19 +521,20 @@ class RequestExecutor:
                         logger.error("="*80)
                         logger.error(f"URL: {url}")
                         logger.error(f"Method: {method}")
-                        logger.error(f"Response Code: {response.status_code}")
+                        logger.error(f"Response Code: {status_code}")
                         logger.error(f"Expected Code: {expected_status}")
                         logger.error(f"Request Headers: {processed_headers}")
                         if body:
                             logger.error(f"Request Body: {body}")
                         logger.error(f"Response Body: {response.text[:2000]}")  # First 2000 chars
                         logger.error("="*80)
-                else:
-                    response.success()
             
-            if "content" in checks:
-                expected_content = checks["content"]
-                if expected_content not in response.text:
+            expected_content = checks.get("content")
+            if expected_content is not None:
+                resp_text = response.text
+                if expected_content in resp_text:
+                    response.success()
+                else:
                     response.failure(f"Content check failed: '{expected_content}' not found")
                     
                     # Debug logging for failures
@@ -491,10 +549,8 @@ class RequestExecutor:
                         logger.error(f"Request Headers: {processed_headers}")
                         if body:
                             logger.error(f"Request Body: {body}")
-                        logger.error(f"Response Body: {response.text[:2000]}")
+                        logger.error(f"Response Body: {resp_text[:2000]}")
                         logger.error("="*80)
-                else:
-                    response.success()
             
             # Handle correlation
             if "correlations" in transaction_config:
@@ -504,7 +560,7 @@ class RequestExecutor:
                     scope = corr.get("scope", "session")
                     if pattern and var_name:
                         self.corr_engine.extract_and_store(
-                            response.text, pattern, var_name, scope, user_id
+                            response.text, pattern, var_name, scope, session
                         )
         
         # Apply think time
@@ -522,23 +578,22 @@ class BaseAPIUser(HttpUser):
     host = "http://localhost:8088"
     wait_time = between(0.1, 0.5)
     verify = False  # Disable SSL certificate verification
+    script = []
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        # Disable SSL verification
+        # HttpUser does not apply the class-level verify flag to its session
         self.client.verify = False
         
-        # Disable SSL warnings
-        import urllib3
-        urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
-        
         self.executor = RequestExecutor(self.client, var_manager, corr_engine, throughput_timer)
         self.user_id = id(self)
-        self.script = []
         self.iteration = 0  # Track iteration count
 
     def on_start(self):
         self.executor = RequestExecutor(self.client, var_manager, corr_engine, throughput_timer)
+        self.corr_session = {}  # Per-user correlation values, dropped with the user
+        if self.script:
+            self.client.headers.update(self.script[0]["_session_headers"])
 
     def execute_script(self):
         """Execute all transactions in the script"""
@@ -551,7 +606,9 @@ class BaseAPIUser(HttpUser):
         
         for transaction in self.script:
             try:
-                self.executor.execute_request(transaction, self.user_id, self.iteration)
+                self.executor.execute_request(
+                    transaction, self.user_id, self.iteration, session=self.corr_session
+                )
             except StopIteration:
                 self.environment.runner.quit()
                 break
@@ -564,46 +621,38 @@ class BaseAPIUser(HttpUser):
 # ============================================================
 # SCENARIO USERS
 # ============================================================
-class Script_01_User(BaseAPIUser):
-    weight = 1
-
-    def on_start(self):
-        super().on_start()
-        self.script = Script_01
+class ScenarioUser(BaseAPIUser):
+    """Runs the bound script while its scenario is selected"""
+    abstract = True
+    scenario_id = None
 
     @task
     def run_script(self):
-        with SCENARIO_LOCK:
-            if "Script_01" not in ACTIVE_SCENARIOS:
-                time.sleep(1)
-                return
+        if self.scenario_id not in ACTIVE_SCENARIOS:
+            time.sleep(1)
+            return
         self.execute_script()
 
 
-class Script_02_User(BaseAPIUser):
-    weight = 1
-
-    def on_start(self):
-        super().on_start()
-        self.script = Script_02
-
-    @task
-    def run_script(self):
-        with SCENARIO_LOCK:
-            if "Script_02" not in ACTIVE_SCENARIOS:
-                time.sleep(1)
-                return
-        self.execute_script()
+# One user class per stage, e.g. Script_01_User, so Locust can weight them independently
+SCENARIO_USERS = {}
+for stage in stages:
+    scenario_id = stage["scenario"]
+    class_name = f"{scenario_id}_User"
+    SCENARIO_USERS[scenario_id] = globals()[class_name] = type(
+        class_name,
+        (ScenarioUser,),
+        {"__module__": __name__, "scenario_id": scenario_id, "script": SCRIPTS[scenario_id], "weight": 1},
+    )
 
 
 def update_user_class_weights():
     """Update user class weights based on active scenarios"""
-    with SCENARIO_LOCK:
-        active = ACTIVE_SCENARIOS.copy()
+    active = ACTIVE_SCENARIOS
     
     # Set weights to 1 if scenario is active, 0 if inactive
-    Script_01_User.weight = 1 if "Script_01" in active else 0
-    Script_02_User.weight = 1 if "Script_02" in active else 0
+    for scenario_id, user_class in SCENARIO_USERS.items():
+        user_class.weight = 1 if scenario_id in active else 0
 
 
 
@@ -623,8 +672,7 @@ class CustomLoadShape(LoadTestShape):
                 return (2, 2)
             return None
 
-        with SCENARIO_LOCK:
-            active = ACTIVE_SCENARIOS.copy()
+        active = ACTIVE_SCENARIOS
 
         if not active:
             return (0, 1)
@@ -665,8 +713,7 @@ def add_scenario_selector(environment, **kwargs):
 
         scenario_list = sorted(set(stage["script_name"] for stage in stages))
 
-        with SCENARIO_LOCK:
-            active = ACTIVE_SCENARIOS.copy()
+        active = ACTIVE_SCENARIOS
 
         # Build Stage Table Rows
         table_rows = ""
@@ -786,6 +833,7 @@ def add_scenario_selector(environment, **kwargs):
 
     @environment.web_ui.app.route("/apply_scenarios", methods=["POST"])
     def apply_scenarios():
+        global ACTIVE_SCENARIOS
 
         data = request.get_json()
         selected = set(data.get("selected", []))
@@ -793,9 +841,7 @@ def add_scenario_selector(environment, **kwargs):
         if not selected:
             return jsonify({"success": False, "error": "Select at least one scenario"})
 
-        with SCENARIO_LOCK:
-            ACTIVE_SCENARIOS.clear()
-            ACTIVE_SCENARIOS.update(selected)
+        ACTIVE_SCENARIOS = frozenset(selected)
 
         # Update master weights
         update_user_class_weights()
@@ -816,9 +862,7 @@ def register_worker_listener(environment, **kwargs):
         def on_update_scenarios(environment, msg, **kw):
             global ACTIVE_SCENARIOS
 
-            with SCENARIO_LOCK:
-                ACTIVE_SCENARIOS.clear()
-                ACTIVE_SCENARIOS.update(msg.data)
+            ACTIVE_SCENARIOS = frozenset(msg.data)
 
             update_user_class_weights()
 
@@ -828,8 +872,7 @@ def register_worker_listener(environment, **kwargs):
         )
 
 def update_user_class_weights():
-    with SCENARIO_LOCK:
-        active = ACTIVE_SCENARIOS.copy()
+    active = ACTIVE_SCENARIOS
 
-    Script_01_User.weight = 1 if "Script_01" in active else 0
-    Script_02_User.weight = 1 if "Script_02" in active else 0
+    for scenario_id, user_class in SCENARIO_USERS.items():
+        user_class.weight = 1 if scenario_id in active else 0
@@ -1,14 +1,63 @@
 """
 Main Locustfile - Multi-site Load Testing
-Dynamically imports test classes from scripts
+Dynamically imports test classes from scripts folder
+
+Set LOCUST_SITE to a comma-separated list of google, demoblaze and opencart
+to load only those sites' test classes; all of them are loaded when it is unset.
+LOCUST_DNS_CACHE_TTL sets how many seconds DNS answers are reused (default 30).
 """
 
-from google_load_test import GoogleLoadTest
-from demoblaze_load_test import DemoBlazeLoadTest
-from opencart_load_test import OpenCartLoadTest
+import sys
+import os
+import time
+
+import gevent.socket
+
+# Add scripts folder to Python path
+scripts_dir = os.path.join(os.path.dirname(__file__), 'scripts')
+if os.path.exists(scripts_dir):
+    sys.path.insert(0, scripts_dir)
+
+# Cache DNS answers briefly: every User hits one fixed host, so most connections
+# can skip getaddrinfo. This applies to every lookup in the process, and while an
+# answer is cached all new connections use the same address list; the TTL lets
+# round-robin and rotated IPs come through again. Hostnames are left untouched,
+# which keeps the Host header and TLS SNI correct.
+DNS_CACHE_TTL = float(os.environ.get("LOCUST_DNS_CACHE_TTL", "30"))
+_dns_cache = {}
+
+
+def _cached_getaddrinfo(*args, _resolve=gevent.socket.getaddrinfo, **kwargs):
+    """getaddrinfo that reuses each answer for DNS_CACHE_TTL seconds"""
+    key = (args, tuple(sorted(kwargs.items())))
+    now = time.monotonic()
+    cached = _dns_cache.get(key)
+    if cached is not None and cached[0] > now:
+        return cached[1]
+    result = _resolve(*args, **kwargs)
+    _dns_cache[key] = (now + DNS_CACHE_TTL, result)
+    return result
+
+
+gevent.socket.getaddrinfo = _cached_getaddrinfo
+
+# Import test classes from individual scripts, optionally limited to some sites.
+# Locust finds User classes in the module namespace, so no re-export is needed.
+KNOWN_SITES = {"google", "demoblaze", "opencart"}
+LOCUST_SITES = {
+    site.strip().lower() for site in os.environ.get("LOCUST_SITE", "").split(",") if site.strip()
+}
+
+unknown_sites = LOCUST_SITES - KNOWN_SITES
+if unknown_sites:
+    raise ValueError(
+        f"Unknown LOCUST_SITE entries: {', '.join(sorted(unknown_sites))} "
+        f"(expected any of: {', '.join(sorted(KNOWN_SITES))})"
+    )
 
-__all__ = [
-    'GoogleLoadTest',
-    'DemoBlazeLoadTest', 
-    'OpenCartLoadTest'
-]
+if not LOCUST_SITES or "google" in LOCUST_SITES:
+    from google_load_test import GoogleLoadTest  # noqa: F401
+if not LOCUST_SITES or "demoblaze" in LOCUST_SITES:
+    from demoblaze_load_test import DemoBlazeLoadTest  # noqa: F401
+if not LOCUST_SITES or "opencart" in LOCUST_SITES:
+    from opencart_load_test import OpenCartLoadTest  # noqa: F401
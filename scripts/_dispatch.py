@@ -0,0 +1,16 @@
+"""Weighted task selection shared by the load test scripts"""
+
+import itertools
+import random
+
+
+def cumulative_weights(weights):
+    """Return the running totals of the given weights as a tuple"""
+    return tuple(itertools.accumulate(weights))
+
+
+def weighted_picks(items, cum_weights, batch_size=4096):
+    """Yield items chosen by weight forever, drawing batch_size picks per refill"""
+    choices = random.choices
+    while True:
+        yield from choices(items, cum_weights=cum_weights, k=batch_size)
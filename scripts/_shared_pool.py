@@ -0,0 +1,22 @@
+"""Connection pool shared by every FastHttpUser load test in a worker process"""
+
+import os
+
+from geventhttpclient.client import HTTPClientPool
+from locust.contrib.fasthttp import insecure_ssl_context_factory
+
+# FastHttpUser passes client_pool to each user's session, so all users on a
+# worker draw keep-alive sockets from one pool per host instead of one each.
+# A pool replaces the user's own TLS settings, so keep FastHttpUser's default of
+# not verifying certificates. Concurrency caps open sockets per host for the whole
+# worker and waiting for one counts as request time, so it must be at least the
+# most users a worker runs; set LOCUST_POOL_CONCURRENCY to raise it.
+# Connection and network timeouts also come from here: FastHttpUser's own
+# timeout attributes are not used when a client_pool is set.
+POOL = HTTPClientPool(
+    concurrency=int(os.environ.get("LOCUST_POOL_CONCURRENCY", "10000")),
+    connection_timeout=10.0,
+    network_timeout=30.0,
+    insecure=True,
+    ssl_context_factory=insecure_ssl_context_factory,
+)
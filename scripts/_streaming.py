@@ -0,0 +1,11 @@
+"""Helpers for responses requested with stream=True"""
+
+
+def discard_body(response, chunk_size=65536):
+    """Read a streamed response to the end without keeping it, so its socket can be reused"""
+    stream = getattr(response, "stream", None)
+    if stream is None:  # Connection failed; the error is already recorded for this request
+        return
+    read = stream.read
+    while read(chunk_size):
+        pass
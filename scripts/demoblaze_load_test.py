@@ -1,36 +1,45 @@
-from locust import HttpUser, task, between
+import random
 
+from locust import task, constant_pacing
+from locust.contrib.fasthttp import FastHttpUser
 
-class DemoBlazeLoadTest(HttpUser):
+from _shared_pool import POOL
+from _streaming import discard_body
+
+# Electronics, Laptops, Monitors, Phones
+_PRODUCT_URLS = ("/product/1", "/product/2", "/product/3", "/product/4")
+
+# Form bodies are constant, so encode them once instead of on every post
+_ADD_BODY = b"cart_product=1"
+_FORM_HEADERS = {"Content-Type": "application/x-www-form-urlencoded"}
+
+
+class DemoBlazeLoadTest(FastHttpUser):
     """Load test for DemoBlaze - E-commerce Demo Site"""
-    wait_time = between(2, 5)
-    
-    def on_start(self):
-        """Execute on user start"""
-        pass
+    wait_time = constant_pacing(3.5)
+    client_pool = POOL  # Shared keep-alive sockets; timeouts are set on POOL, see _shared_pool
     
     @task(3)
-    def browse_products(self):
+    def browse_products(self, _choice=random.choice, _urls=_PRODUCT_URLS):
         """Browse product categories"""
-        categories = [1, 2, 3, 4]  # Electronics, Laptops, Monitors, Phones
-        self.client.get(f"/product/{categories[0]}")
+        self.client.get(_choice(_urls), name="demoblaze:browse_products")
     
     @task(2)
     def view_product_detail(self):
         """View individual product details"""
-        self.client.get("/prod?idp_=1")
+        self.client.get("/prod?idp_=1", name="demoblaze:view_product_detail")
     
     @task(1)
     def add_to_cart(self):
         """Simulate adding to cart"""
-        self.client.post("/", {"cart_product": "1"})
+        self.client.post("/", data=_ADD_BODY, headers=_FORM_HEADERS, name="demoblaze:add_to_cart")
     
     @task(1)
     def view_cart(self):
         """View shopping cart"""
-        self.client.get("/cart.html")
+        self.client.get("/cart.html", name="demoblaze:view_cart")
     
     @task(2)
     def homepage(self):
         """Visit homepage"""
-        self.client.get("/")
+        discard_body(self.client.get("/", stream=True, name="demoblaze:homepage"))
@@ -1,25 +1,34 @@
-from locust import HttpUser, task, between
+import random
 
+from locust import task, constant_pacing
+from locust.contrib.fasthttp import FastHttpUser
 
-class GoogleLoadTest(HttpUser):
+from _shared_pool import POOL
+from _streaming import discard_body
+
+_SEARCH_URLS = (
+    "/search?q=locust+performance+testing",
+    "/search?q=python+load+testing",
+    "/search?q=kubernetes+argocd",
+)
+
+
+class GoogleLoadTest(FastHttpUser):
     """Load test for Google Search"""
-    wait_time = between(1, 3)
-    
-    def on_start(self):
-        """Execute on user start"""
-        pass
+    wait_time = constant_pacing(2)
+    client_pool = POOL  # Shared keep-alive sockets; timeouts are set on POOL, see _shared_pool
     
     @task(2)
-    def search_query(self):
+    def search_query(self, _choice=random.choice, _urls=_SEARCH_URLS):
         """Simulate Google search queries"""
-        self.client.get("/search?q=locust+performance+testing")
+        self.client.get(_choice(_urls), name="google:search_query")
     
     @task(1)
     def homepage(self):
         """Visit Google homepage"""
-        self.client.get("/")
+        discard_body(self.client.get("/", stream=True, name="google:homepage"))
     
     @task(1)
     def images_search(self):
         """Search images on Google"""
-        self.client.get("/search?q=python&tbm=isch")
+        self.client.get("/search?q=python&tbm=isch", name="google:images_search")
@@ -1,46 +1,77 @@
-from locust import HttpUser, task, between
+import random
 
+from locust import task, constant_pacing
+from locust.contrib.fasthttp import FastHttpUser
 
-class OpenCartLoadTest(HttpUser):
+from _dispatch import cumulative_weights, weighted_picks
+from _shared_pool import POOL
+from _streaming import discard_body
+
+# Desktops, Laptops & Notebooks, Tablets, Phones & PDAs
+_CATEGORY_URLS = (
+    "/index.php?route=product/category&path=20",
+    "/index.php?route=product/category&path=18",
+    "/index.php?route=product/category&path=57",
+    "/index.php?route=product/category&path=24",
+)
+
+# Form bodies are constant, so encode them once instead of on every post
+_ADD_BODY = b"product_id=28&quantity=1"
+_FORM_HEADERS = {"Content-Type": "application/x-www-form-urlencoded"}
+
+
+class OpenCartLoadTest(FastHttpUser):
     """Load test for OpenCart - Open Source E-commerce Platform"""
-    wait_time = between(1, 4)
+    wait_time = constant_pacing(2.5)
+    client_pool = POOL  # Shared keep-alive sockets; timeouts are set on POOL, see _shared_pool
     
-    def on_start(self):
-        """Execute on user start"""
-        pass
-    
-    @task(3)
-    def browse_categories(self):
+    def browse_categories(self, _choice=random.choice, _urls=_CATEGORY_URLS):
         """Browse product categories"""
-        self.client.get("/index.php?route=product/category&path=20")
+        self.client.get(_choice(_urls), name="opencart:browse_categories")
     
-    @task(2)
     def search_products(self):
         """Search for products"""
-        self.client.get("/index.php?route=product/search&search=laptop")
+        self.client.get("/index.php?route=product/search&search=laptop", name="opencart:search_products")
     
-    @task(2)
     def product_details(self):
         """View product detail page"""
-        self.client.get("/index.php?route=product/product&product_id=28")
+        self.client.get("/index.php?route=product/product&product_id=28", name="opencart:product_details")
     
-    @task(1)
     def add_to_cart(self):
         """Add product to shopping cart"""
-        self.client.post("/index.php?route=checkout/cart/add", 
-                        {"product_id": 28, "quantity": 1})
+        self.client.post("/index.php?route=checkout/cart/add",
+                         data=_ADD_BODY, headers=_FORM_HEADERS, name="opencart:add_to_cart")
     
-    @task(1)
     def view_cart(self):
         """View shopping cart"""
-        self.client.get("/index.php?route=checkout/cart")
+        self.client.get("/index.php?route=checkout/cart", name="opencart:view_cart")
     
-    @task(1)
     def checkout(self):
         """Proceed to checkout"""
-        self.client.get("/index.php?route=checkout/checkout")
+        self.client.get("/index.php?route=checkout/checkout", name="opencart:checkout")
     
-    @task(2)
     def homepage(self):
         """Visit store homepage"""
-        self.client.get("/")
+        discard_body(self.client.get("/", stream=True, name="opencart:homepage"))
+    
+    @task
+    def dispatch(self):
+        """Run one request, picked by weight from _WEIGHTED_TASKS"""
+        next(_TASK_PICKS)(self)
+
+
+# One weighted table instead of per-method @task(n) entries
+_WEIGHTED_TASKS = (
+    (3, OpenCartLoadTest.browse_categories),
+    (2, OpenCartLoadTest.search_products),
+    (2, OpenCartLoadTest.product_details),
+    (1, OpenCartLoadTest.add_to_cart),
+    (1, OpenCartLoadTest.view_cart),
+    (1, OpenCartLoadTest.checkout),
+    (2, OpenCartLoadTest.homepage),
+)
+_TASK_FUNCS = tuple(func for _, func in _WEIGHTED_TASKS)
+_CUM_WEIGHTS = cumulative_weights(weight for weight, _ in _WEIGHTED_TASKS)
+# Draws are independent and next() never yields under gevent, so every user on
+# the worker can share one stream of picks instead of buffering its own.
+_TASK_PICKS = weighted_picks(_TASK_FUNCS, _CUM_WEIGHTS)